@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import text
+
+# Сколько последних событий держим в памяти для возобновления по Last-Event-ID
+HISTORY_SIZE = 1000
+
+# Максимальная длина очереди одного клиента. Если клиент не успевает
+# читать, он получает событие reset и должен перезагрузить данные.
+SUBSCRIBER_QUEUE_SIZE = 500
+
+# Канал PostgreSQL для LISTEN/NOTIFY
+NOTIFY_CHANNEL = 'school_changes'
+
+# Ключ advisory-блокировки: номера событий выдаются и уходят в NOTIFY по порядку
+EVENTS_LOCK_KEY = 726002
+
+# Последний выданный номер события во всех процессах
+LAST_EVENT_ID_SQL = "SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM change_events_seq"
+
+# Пауза между попытками переподключения слушателя (растет вдвое до максимума)
+RECONNECT_DELAY_MIN = 1.0
+RECONNECT_DELAY_MAX = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Подписка одного клиента на ленту изменений"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+        # События с номерами до этого у клиента уже есть
+        self.skip_until = 0
+
+    def push(self, event):
+        # Вызывается в потоке цикла событий подписчика
+        if self.overflowed:
+            return
+        if event is not None and event['id'] <= self.skip_until:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventBroker:
+    """Локальный брокер событий изменений (один процесс).
+
+    Обработчики CRUD вызывают publish() из пула потоков FastAPI,
+    а SSE-клиенты читают события через subscribe() в цикле asyncio.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.subscribers = set()
+        self.listeners = []
+        self.reset_listeners = []
+        # События с меньшими номерами этот процесс мог не получить
+        self.resume_floor = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def add_listener(self, callback):
+        """Подписка кода сервера: callback(table, action, row) на каждое событие"""
+        self.listeners.append(callback)
+
+    def add_reset_listener(self, callback):
+        """callback() вызывается, когда часть событий потеряна и кеши надо перестроить"""
+        self.reset_listeners.append(callback)
+
+    def reset(self):
+        """Сообщает кешам и SSE-клиентам, что события пропущены: им нужна полная перезагрузка"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in self.reset_listeners:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Ошибка обработчика сброса ленты изменений")
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub.push, None)
+            except RuntimeError:
+                self.unsubscribe(sub)
+
+    def publish(self, table, action, row):
+        """Публикация изменения строки: action = insert / update / delete"""
+        with self.lock:
+            # Номер выдается под той же блокировкой, что и запись в историю:
+            # иначе событие 6 могло бы попасть к клиенту раньше события 5
+            self.last_id += 1
+            event = {
+                'id': self.last_id,
+                'table': table,
+                'action': action,
+                'row': row,
+                'ts': datetime.utcnow().isoformat(),
+            }
+            self._record(event)
+        self._notify_listeners(event)
+        return event
+
+    def dispatch(self, event):
+        """Рассылка события с уже выданным номером всем подписчикам этого процесса"""
+        with self.lock:
+            self.last_id = max(self.last_id, event['id'])
+            self._record(event)
+        self._notify_listeners(event)
+
+    def _record(self, event):
+        # Вызывается под self.lock: история и очереди клиентов идут в порядке номеров
+        self.history.append(event)
+        for sub in list(self.subscribers):
+            try:
+                sub.loop.call_soon_threadsafe(sub.push, event)
+            except RuntimeError:
+                # Цикл событий уже закрыт
+                self.subscribers.discard(sub)
+
+    def _notify_listeners(self, event):
+        for callback in self.listeners:
+            # Ошибка одного кеша не должна ломать запись и остальных слушателей
+            try:
+                callback(event['table'], event['action'], event['row'])
+            except Exception:
+                logger.exception("Ошибка обработчика события %s", event.get('id'))
+
+    def current_id(self):
+        """Номер последнего события, известного этому процессу"""
+        with self.lock:
+            return self.last_id
+
+    def issued_id(self):
+        """Последний выданный номер события во всех процессах (точка возобновления для клиента)"""
+        return self.current_id()
+
+    def subscribe(self, last_event_id=None, issued_id=None):
+        """Новая подписка и события, пропущенные с last_event_id.
+
+        issued_id - результат issued_id(), нужен, чтобы отличить номер,
+        выданный другим воркером, от номера из прошлого запуска сервера.
+        Если нужных событий уже нет в истории, вместо них возвращается None,
+        и клиент должен перезагрузить данные целиком.
+        """
+        sub = Subscription(asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.add(sub)
+            if last_event_id is None:
+                missed = []
+            elif last_event_id > self.last_id:
+                if issued_id is not None and last_event_id <= issued_id:
+                    # Номер выдан, но уведомление до этого процесса еще не дошло:
+                    # более ранние события у клиента уже есть
+                    sub.skip_until = last_event_id
+                    missed = []
+                else:
+                    # Сервер перезапускался, номер клиенту неизвестен
+                    missed = None
+            elif (last_event_id < self.resume_floor
+                  or (self.history and self.history[0]['id'] > last_event_id + 1)):
+                # Процесс терял соединение или история уже вытеснена
+                missed = None
+            else:
+                missed = [e for e in self.history if e['id'] > last_event_id]
+        return sub, missed
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+
+class PgNotifyBroker(EventBroker):
+    """Брокер для нескольких воркеров uvicorn через LISTEN/NOTIFY.
+
+    Номер события берется из последовательности в базе, чтобы он совпадал
+    во всех процессах, а рассылка идет только из потока-слушателя:
+    свои события процесс получает так же, как и чужие.
+    """
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+        self.listener = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE SEQUENCE IF NOT EXISTS change_events_seq"))
+        self.stopping.clear()
+        self.listener = threading.Thread(target=self._listen, name="change-feed-listener", daemon=True)
+        self.listener.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.listener:
+            self.listener.join(timeout=5)
+            self.listener = None
+
+    def publish(self, table, action, row):
+        event = {
+            'table': table,
+            'action': action,
+            'row': row,
+            'ts': datetime.utcnow().isoformat(),
+        }
+        with self.engine.begin() as conn:
+            # Блокировка до commit: следующий номер выдается только после того,
+            # как NOTIFY с предыдущим ушел, поэтому уведомления приходят по порядку
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': EVENTS_LOCK_KEY})
+            event['id'] = conn.execute(text("SELECT nextval('change_events_seq')")).scalar()
+            conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {'channel': NOTIFY_CHANNEL, 'payload': json.dumps(event, default=str)},
+            )
+        return event
+
+    def issued_id(self):
+        # Номер из общей последовательности одинаков для всех воркеров
+        with self.engine.connect() as conn:
+            return conn.execute(text(LAST_EVENT_ID_SQL)).scalar()
+
+    def _connected(self, current_id, events_lost):
+        """Слушатель подключился; current_id - последний выданный номер события"""
+        with self.lock:
+            self.resume_floor = current_id
+            self.last_id = max(self.last_id, current_id)
+            if events_lost:
+                self.history.clear()
+        if events_lost:
+            self.reset()
+
+    def _listen(self):
+        """Поток-слушатель: переподключается с нарастающей паузой при любой ошибке"""
+        delay = RECONNECT_DELAY_MIN
+        connected_before = False
+        while not self.stopping.is_set():
+            conn = None
+            try:
+                conn = self.engine.raw_connection()
+                # Отдельное соединение: с autocommit и LISTEN оно не должно вернуться в пул
+                conn.detach()
+                dbapi_conn = conn.driver_connection
+                dbapi_conn.autocommit = True
+                cursor = dbapi_conn.cursor()
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                cursor.execute(LAST_EVENT_ID_SQL)
+                # Пока соединения не было, уведомления терялись
+                self._connected(cursor.fetchone()[0], events_lost=connected_before)
+                connected_before = True
+                delay = RECONNECT_DELAY_MIN
+                self._receive(dbapi_conn)
+            except Exception:
+                logger.exception("Соединение LISTEN потеряно, повтор через %.0f с", delay)
+                self.stopping.wait(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _receive(self, dbapi_conn):
+        while not self.stopping.is_set():
+            if select.select([dbapi_conn], [], [], 1.0) == ([], [], []):
+                continue
+            dbapi_conn.poll()
+            while dbapi_conn.notifies:
+                notify = dbapi_conn.notifies.pop(0)
+                try:
+                    self.dispatch(json.loads(notify.payload))
+                except Exception:
+                    logger.exception("Не удалось обработать уведомление: %.200s", notify.payload)
+
+
+def create_broker(engine):
+    """Выбор брокера: LISTEN/NOTIFY на PostgreSQL, локальный в остальных случаях"""
+    if engine.dialect.name == 'postgresql':
+        return PgNotifyBroker(engine)
+    return EventBroker()
+
+
+def format_sse(event):
+    """Событие в формате text/event-stream"""
+    if event is None:
+        return "event: reset\ndata: {}\n\n"
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: change\ndata: {data}\n\n"
+
+
+# Интервал комментариев-пингов, чтобы прокси не закрывали соединение
+HEARTBEAT_INTERVAL = 15.0
+
+
+async def event_stream(broker, sub, missed, request):
+    """Генератор SSE-потока для одного клиента"""
+    try:
+        yield "retry: 3000\n\n"
+        if missed is None:
+            yield format_sse(None)
+            return
+        for event in missed:
+            yield format_sse(event)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+            yield format_sse(event)
+            if event is None:
+                return
+    finally:
+        broker.unsubscribe(sub)
@@ -234,11 +234,15 @@ def create_schedule_excel(group, schedules, subjects_dict):
     return buffer
 
 
-def create_student_certificate_pdf(student, group_name):
-    """Создание справки студента в PDF - отличается от Word версии"""
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
+# Зарегистрированные шрифты для PDF (регистрация один раз на процесс)
+_pdf_fonts = None
+
+
+def register_pdf_fonts():
+    """Регистрация шрифтов с кириллицей, возвращает (обычный, жирный)"""
+    global _pdf_fonts
+    if _pdf_fonts is not None:
+        return _pdf_fonts
 
     # Регистрация русского шрифта (DejaVu Sans поддерживает кириллицу)
     try:
@@ -259,6 +263,15 @@ def create_student_certificate_pdf(student, group_name):
             font_regular = 'Helvetica'
             font_bold = 'Helvetica-Bold'
 
+    _pdf_fonts = (font_regular, font_bold)
+    return _pdf_fonts
+
+
+def draw_certificate_page(c, student, group_name):
+    """Отрисовка справки студента на текущей странице холста"""
+    width, height = A4
+    font_regular, font_bold = register_pdf_fonts()
+
     # === РАМКА ДОКУМЕНТА ===
     c.setStrokeColorRGB(0.2, 0.2, 0.8)
     c.setLineWidth(2)
@@ -380,12 +393,38 @@ def create_student_certificate_pdf(student, group_name):
     c.drawString(80, y, "М.П.")
 
     # Добавляем изображение печати
+    # (reportlab хранит одинаковые изображения в документе один раз)
     stamp_path = 'stamp.png'
     if os.path.exists(stamp_path):
         # Вставляем печать рядом с "М.П."
         c.drawImage(stamp_path, 110, y - 50, width=80, height=80, preserveAspectRatio=True, mask='auto')
 
+
+def create_student_certificate_pdf(student, group_name):
+    """Создание справки студента в PDF - отличается от Word версии"""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    draw_certificate_page(c, student, group_name)
     c.save()
     buffer.seek(0)
 
-    return buffer
\ No newline at end of file
+    return buffer
+
+
+def create_certificates_pdf(students, group_names, output, on_page=None):
+    """Справки нескольких студентов одним PDF, по справке на страницу.
+
+    Шрифты и печать встраиваются в документ один раз, поэтому каждая
+    следующая страница добавляет только свой текст.
+    group_names - словарь id группы -> название, output - файл для записи,
+    on_page(номер, всего) вызывается после каждой страницы.
+    """
+    c = canvas.Canvas(output, pagesize=A4)
+    for i, student in enumerate(students, start=1):
+        draw_certificate_page(c, student, group_names.get(student.group_id))
+        c.showPage()
+        if on_page:
+            on_page(i, len(students))
+    c.save()
+
+    return output
\ No newline at end of file
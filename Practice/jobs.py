@@ -0,0 +1,377 @@
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from export_utils import create_student_certificate, create_schedule_excel, create_certificates_pdf
+
+# Папка для готовых файлов экспорта
+EXPORT_DIR = 'exports'
+
+# Ограничения параллельности: всего воркеров и сколько из них могут
+# одновременно заниматься "большими" задачами. Остальные воркеры всегда
+# свободны для маленьких задач, поэтому большие их не блокируют.
+MAX_WORKERS = 3
+MAX_LARGE_JOBS = 1
+
+# Задача считается большой, если в ней больше стольких документов
+LARGE_JOB_THRESHOLD = 30
+
+# Приоритеты по умолчанию (чем больше, тем раньше берется задача)
+PRIORITY_SMALL = 10
+PRIORITY_LARGE = 0
+
+# Как часто воркер проверяет очередь, если его не разбудили
+POLL_INTERVAL = 2.0
+
+# Аренда задачи: воркер продлевает ее не реже HEARTBEAT_INTERVAL секунд.
+# Если отметка старше JOB_LEASE, процесс упал или перезапустился,
+# и задача возвращается в очередь (не больше MAX_ATTEMPTS раз).
+HEARTBEAT_INTERVAL = 15
+JOB_LEASE = timedelta(minutes=2)
+MAX_ATTEMPTS = 3
+
+# Сколько хранить готовые файлы и как часто искать просроченные
+RESULT_RETENTION = timedelta(hours=24)
+SWEEP_INTERVAL = 60
+
+# Ключ advisory-блокировки PostgreSQL для выбора задач из очереди
+CLAIM_LOCK_KEY = 726001
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ('group_certificates', 'group_schedule', 'all_schedules')
+
+
+class JobError(Exception):
+    """Ошибка постановки задачи в очередь"""
+
+
+# === ПОСТАНОВКА В ОЧЕРЕДЬ ===
+
+def _estimate_size(db: Session, kind, params):
+    """Количество документов, которое придется сформировать"""
+    if kind == 'group_certificates':
+        return db.query(models.Student).filter(models.Student.group_id == params['group_id']).count()
+    if kind == 'all_schedules':
+        return db.query(models.Group).count()
+    return 1
+
+
+def enqueue_job(db: Session, kind, group_id=None, fmt='pdf', priority=None):
+    """Создание задачи экспорта в очереди"""
+    if kind not in JOB_KINDS:
+        raise JobError(f"Неизвестный тип экспорта: {kind}")
+
+    params = {}
+    if kind in ('group_certificates', 'group_schedule'):
+        if group_id is None:
+            raise JobError("Не указана группа")
+        if not db.query(models.Group).filter(models.Group.id == group_id).first():
+            raise JobError("Группа не найдена")
+        params['group_id'] = group_id
+    if kind == 'group_certificates':
+        if fmt not in ('pdf', 'word'):
+            raise JobError(f"Неизвестный формат: {fmt}")
+        params['format'] = fmt
+
+    is_large = _estimate_size(db, kind, params) > LARGE_JOB_THRESHOLD
+    if priority is None:
+        priority = PRIORITY_LARGE if is_large else PRIORITY_SMALL
+
+    job = models.ExportJob(
+        kind=kind,
+        params=json.dumps(params),
+        priority=priority,
+        is_large=is_large,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    worker_pool.notify()
+    return job
+
+
+def claim_next_job(db: Session, max_large=MAX_LARGE_JOBS):
+    """Забирает самую приоритетную задачу из очереди.
+
+    На PostgreSQL строка блокируется через FOR UPDATE SKIP LOCKED, поэтому
+    несколько процессов могут разбирать одну очередь без брокера.
+    Лимит больших задач считается по всей очереди в базе; на PostgreSQL
+    выбор задач всех процессов упорядочен advisory-блокировкой до commit,
+    поэтому подсчет и захват не разъезжаются. На SQLite блокировка
+    игнорируется, и внутри процесса выбор защищает блокировка пула.
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CLAIM_LOCK_KEY})
+
+    running_large = (
+        db.query(models.ExportJob)
+        .filter(models.ExportJob.status == 'running', models.ExportJob.is_large == True)  # noqa: E712
+        .count()
+    )
+    query = db.query(models.ExportJob).filter(models.ExportJob.status == 'queued')
+    if running_large >= max_large:
+        query = query.filter(models.ExportJob.is_large == False)  # noqa: E712
+    job = (
+        query.order_by(models.ExportJob.priority.desc(), models.ExportJob.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not job:
+        db.rollback()
+        return None
+
+    job.status = 'running'
+    job.started_at = job.heartbeat_at = datetime.utcnow()
+    job.attempts += 1
+    db.commit()
+    return job
+
+
+def recover_stale_jobs(db: Session, now=None):
+    """Возвращает в очередь задачи, чей воркер перестал продлевать аренду"""
+    now = now or datetime.utcnow()
+    stale = (
+        db.query(models.ExportJob)
+        .filter(models.ExportJob.status == 'running', models.ExportJob.heartbeat_at < now - JOB_LEASE)
+        .all()
+    )
+    for job in stale:
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = 'failed'
+            job.error = "Задача прервана слишком много раз"
+            job.finished_at = now
+        else:
+            job.status = 'queued'
+            job.progress = 0
+            job.started_at = None
+            job.heartbeat_at = None
+    db.commit()
+    return len(stale)
+
+
+def purge_expired_results(db: Session, now=None):
+    """Удаляет файлы готовых задач старше срока хранения.
+
+    Упавшие задачи файла не имеют и остаются в состоянии failed с текстом ошибки.
+    """
+    now = now or datetime.utcnow()
+    expired = (
+        db.query(models.ExportJob)
+        .filter(models.ExportJob.status == 'done',
+                models.ExportJob.finished_at < now - RESULT_RETENTION)
+        .all()
+    )
+    for job in expired:
+        if job.result_path and os.path.exists(job.result_path):
+            os.remove(job.result_path)
+        job.status = 'expired'
+        job.result_path = None
+    db.commit()
+    return len(expired)
+
+
+# === ФОРМИРОВАНИЕ ДОКУМЕНТОВ ===
+
+def _group_name(db: Session, group_id):
+    group = db.query(models.Group).filter(models.Group.id == group_id).first()
+    return group.name if group else None
+
+
+def _run_group_certificates(db: Session, params, path, report):
+    """Справки всех студентов группы: PDF одним документом, Word - zip-архивом"""
+    group_name = _group_name(db, params['group_id'])
+    students = (
+        db.query(models.Student)
+        .filter(models.Student.group_id == params['group_id'])
+        .order_by(models.Student.surname, models.Student.name)
+        .all()
+    )
+
+    if params.get('format') == 'pdf':
+        with open(path, 'wb') as f:
+            create_certificates_pdf(students, {params['group_id']: group_name}, f, on_page=report)
+        report(1, 1)
+        return f"certificates_{group_name}.pdf", 'application/pdf'
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i, student in enumerate(students, start=1):
+            buffer = create_student_certificate(student, group_name)
+            name = f"certificate_{student.id}_{student.surname}_{student.name}.docx"
+            archive.writestr(name, buffer.getvalue())
+            report(i, len(students))
+
+    return f"certificates_{group_name}.zip", 'application/zip'
+
+
+def _run_group_schedule(db: Session, params, path, report):
+    """Расписание одной группы в Excel"""
+    group = db.query(models.Group).filter(models.Group.id == params['group_id']).first()
+    schedules = db.query(models.Schedule).filter(models.Schedule.group_id == group.id).all()
+    subjects_dict = {s.id: s.name for s in db.query(models.Subject).all()}
+
+    buffer = create_schedule_excel(group, schedules, subjects_dict)
+    with open(path, 'wb') as f:
+        f.write(buffer.getvalue())
+    report(1, 1)
+
+    return f"schedule_{group.name}.xlsx", 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _run_all_schedules(db: Session, params, path, report):
+    """Расписания всех групп колледжа одним zip-архивом"""
+    groups = db.query(models.Group).order_by(models.Group.name).all()
+    subjects_dict = {s.id: s.name for s in db.query(models.Subject).all()}
+
+    schedules_by_group = {}
+    for schedule in db.query(models.Schedule).all():
+        schedules_by_group.setdefault(schedule.group_id, []).append(schedule)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i, group in enumerate(groups, start=1):
+            buffer = create_schedule_excel(group, schedules_by_group.get(group.id, []), subjects_dict)
+            archive.writestr(f"schedule_{group.id}_{group.name}.xlsx", buffer.getvalue())
+            report(i, len(groups))
+
+    return "schedules_all.zip", 'application/zip'
+
+
+JOB_RUNNERS = {
+    'group_certificates': _run_group_certificates,
+    'group_schedule': _run_group_schedule,
+    'all_schedules': _run_all_schedules,
+}
+
+
+def run_job(db: Session, job):
+    """Выполнение задачи и сохранение результата на диск"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    # Номер попытки в имени: если живую, но медленную задачу вернули в очередь,
+    # обе попытки пишут каждая в свой файл
+    tmp_path = os.path.join(EXPORT_DIR, f"job_{job.id}_{job.attempts}.part")
+    last_progress = [0]
+    last_heartbeat = [time.monotonic()]
+
+    def report(done, total):
+        progress = int(done * 100 / total) if total else 100
+        # Не пишем в базу на каждый документ, только при заметном изменении
+        # прогресса или когда пора продлить аренду задачи
+        heartbeat_due = time.monotonic() - last_heartbeat[0] >= HEARTBEAT_INTERVAL
+        if progress - last_progress[0] >= 5 or progress == 100 or heartbeat_due:
+            last_progress[0] = progress
+            last_heartbeat[0] = time.monotonic()
+            job.progress = progress
+            job.heartbeat_at = datetime.utcnow()
+            db.commit()
+
+    try:
+        params = json.loads(job.params or '{}')
+        filename, media_type = JOB_RUNNERS[job.kind](db, params, tmp_path, report)
+        final_path = os.path.join(EXPORT_DIR, f"job_{job.id}{os.path.splitext(filename)[1]}")
+        os.replace(tmp_path, final_path)
+
+        job.status = 'done'
+        job.progress = 100
+        job.result_path = final_path
+        job.filename = filename
+        job.media_type = media_type
+    except Exception as e:
+        db.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = datetime.utcnow()
+    db.commit()
+
+
+# === ВОРКЕРЫ ===
+
+class JobWorkerPool:
+    """Пул потоков, разбирающих очередь задач экспорта"""
+
+    def __init__(self, workers=MAX_WORKERS, max_large=MAX_LARGE_JOBS):
+        self.workers = workers
+        self.max_large = max_large
+        self.claim_lock = threading.Lock()
+        self.sweep_lock = threading.Lock()
+        self.last_sweep = None
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return
+        self.stopping.clear()
+        self.sweep(force=True)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"export-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+    def notify(self):
+        """Будит воркеры после постановки новой задачи"""
+        self.wakeup.set()
+
+    def sweep(self, force=False):
+        """Возврат зависших задач и удаление просроченных файлов (не чаще SWEEP_INTERVAL)"""
+        with self.sweep_lock:
+            now = time.monotonic()
+            if not force and self.last_sweep is not None and now - self.last_sweep < SWEEP_INTERVAL:
+                return
+            self.last_sweep = now
+            db = SessionLocal()
+            try:
+                if recover_stale_jobs(db):
+                    self.notify()
+                purge_expired_results(db)
+            finally:
+                db.close()
+
+    def _worker(self):
+        while not self.stopping.is_set():
+            try:
+                self.sweep()
+                found = self.run_once()
+            except Exception:
+                # Ошибка базы не должна останавливать воркер навсегда
+                logger.exception("Ошибка воркера экспорта")
+                found = False
+            if not found:
+                self.wakeup.wait(POLL_INTERVAL)
+                self.wakeup.clear()
+
+    def run_once(self):
+        """Берет и выполняет одну задачу. Возвращает False, если очередь пуста"""
+        db = SessionLocal()
+        try:
+            with self.claim_lock:
+                job = claim_next_job(db, max_large=self.max_large)
+            if job is None:
+                return False
+            run_job(db, job)
+            return True
+        finally:
+            db.close()
+
+
+worker_pool = JobWorkerPool()
@@ -1,17 +1,57 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse, Response, JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from contextlib import asynccontextmanager
 import models
 import schemas
-from database import engine, get_db
-from export_utils import create_student_certificate, create_schedule_excel, create_student_certificate_pdf
+from database import engine, get_db, SessionLocal
+from export_utils import (create_student_certificate, create_schedule_excel, create_student_certificate_pdf,
+                          create_certificates_pdf)
+from jobs import enqueue_job, worker_pool, JobError, LARGE_JOB_THRESHOLD
+from events import create_broker, event_stream
+from sync import ensure_sync_schema, parse_token, get_changes, committed_revision
+from timetable import timetable
+from stats import stats_cache, group_stats, subject_stats, room_stats, room_free_slots
+from ratelimit import (SingleFlight, RateLimiter, RateLimitExceeded,
+                       CLIENT_BURST, CLIENT_RATE, ROUTE_BURST, ROUTE_RATE)
+from static import static_assets
+from starlette.concurrency import run_in_threadpool
 import urllib.parse
+import logging
+import math
+import io
 
 models.Base.metadata.create_all(bind=engine)
+ensure_sync_schema(engine)
 
-app = FastAPI(title="Учебный учет")
+logger = logging.getLogger(__name__)
+
+# Брокер ленты изменений для SSE-клиентов
+broker = create_broker(engine)
+# Кеши обновляются только через брокер (он защищает каждый вызов от ошибок):
+# локальный рассылает событие сразу, PostgreSQL - после NOTIFY, в том числе
+# события других воркеров
+broker.add_listener(timetable.apply_change)
+broker.add_listener(stats_cache.apply_change)
+# Если события были потеряны (обрыв LISTEN), кеши строятся заново
+broker.add_reset_listener(timetable.reset)
+broker.add_reset_listener(stats_cache.invalidate)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Загрузка и сжатие фронтенда, запуск воркеров фонового экспорта и ленты изменений
+    await run_in_threadpool(static_assets.load)
+    worker_pool.start()
+    broker.start()
+    yield
+    broker.stop()
+    worker_pool.stop()
+
+
+app = FastAPI(title="Учебный учет", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -23,6 +63,31 @@ app.add_middleware(
 )
 
 
+def publish_change(table, action, row):
+    """Отправка изменения строки в ленту событий (оттуда же обновляются кеши).
+
+    Вызывается после commit: ошибка ленты не должна превращать уже
+    сохраненную запись в ответ 500, иначе повтор запроса создаст дубликат.
+    Потерянное событие обрабатывается как обрыв ленты - полной перезагрузкой.
+    """
+    try:
+        broker.publish(table, action, row)
+    except Exception:
+        logger.exception("Не удалось опубликовать изменение %s/%s", table, action)
+        broker.reset()
+
+
+def publish_row(table, action, schema, obj):
+    # Ревизия позволяет получателям отбросить событие, пришедшее позже более нового
+    row = schema.model_validate(obj).model_dump()
+    row["revision"] = obj.revision
+    publish_change(table, action, row)
+
+
+def publish_delete(table, row_id, db):
+    publish_change(table, "delete", {"id": row_id, "revision": committed_revision(db)})
+
+
 # API endpoints для студентов
 @app.get("/api/students", response_model=List[schemas.Student])
 def get_students(db: Session = Depends(get_db)):
@@ -35,6 +100,7 @@ def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)
     db.add(db_student)
     db.commit()
     db.refresh(db_student)
+    publish_row("students", "insert", schemas.Student, db_student)
     return db_student
 
 
@@ -47,6 +113,7 @@ def update_student(student_id: int, student: schemas.StudentCreate, db: Session
         setattr(db_student, key, value)
     db.commit()
     db.refresh(db_student)
+    publish_row("students", "update", schemas.Student, db_student)
     return db_student
 
 
@@ -57,6 +124,7 @@ def delete_student(student_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Студент не найден")
     db.delete(db_student)
     db.commit()
+    publish_delete("students", student_id, db)
     return {"message": "Студент удален"}
 
 
@@ -72,6 +140,7 @@ def create_group(group: schemas.GroupCreate, db: Session = Depends(get_db)):
     db.add(db_group)
     db.commit()
     db.refresh(db_group)
+    publish_row("groups", "insert", schemas.Group, db_group)
     return db_group
 
 
@@ -84,6 +153,7 @@ def update_group(group_id: int, group: schemas.GroupCreate, db: Session = Depend
         setattr(db_group, key, value)
     db.commit()
     db.refresh(db_group)
+    publish_row("groups", "update", schemas.Group, db_group)
     return db_group
 
 
@@ -92,8 +162,13 @@ def delete_group(group_id: int, db: Session = Depends(get_db)):
     db_group = db.query(models.Group).filter(models.Group.id == group_id).first()
     if not db_group:
         raise HTTPException(status_code=404, detail="Группа не найдена")
+    # При удалении группы у ее студентов обнуляется group_id - это тоже изменения
+    detached = list(db_group.students)
     db.delete(db_group)
     db.commit()
+    publish_delete("groups", group_id, db)
+    for student in detached:
+        publish_row("students", "update", schemas.Student, student)
     return {"message": "Группа удалена"}
 
 
@@ -109,6 +184,7 @@ def create_subject(subject: schemas.SubjectCreate, db: Session = Depends(get_db)
     db.add(db_subject)
     db.commit()
     db.refresh(db_subject)
+    publish_row("subjects", "insert", schemas.Subject, db_subject)
     return db_subject
 
 
@@ -121,6 +197,7 @@ def update_subject(subject_id: int, subject: schemas.SubjectCreate, db: Session
         setattr(db_subject, key, value)
     db.commit()
     db.refresh(db_subject)
+    publish_row("subjects", "update", schemas.Subject, db_subject)
     return db_subject
 
 
@@ -131,6 +208,7 @@ def delete_subject(subject_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Предмет не найден")
     db.delete(db_subject)
     db.commit()
+    publish_delete("subjects", subject_id, db)
     return {"message": "Предмет удален"}
 
 
@@ -149,6 +227,7 @@ def create_schedule(schedule: schemas.ScheduleCreate, db: Session = Depends(get_
     db.add(db_schedule)
     db.commit()
     db.refresh(db_schedule)
+    publish_row("schedules", "insert", schemas.Schedule, db_schedule)
     return db_schedule
 
 
@@ -161,6 +240,7 @@ def update_schedule(schedule_id: int, schedule: schemas.ScheduleCreate, db: Sess
         setattr(db_schedule, key, value)
     db.commit()
     db.refresh(db_schedule)
+    publish_row("schedules", "update", schemas.Schedule, db_schedule)
     return db_schedule
 
 
@@ -171,48 +251,164 @@ def delete_schedule(schedule_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Расписание не найдено")
     db.delete(db_schedule)
     db.commit()
+    publish_delete("schedules", schedule_id, db)
     return {"message": "Расписание удалено"}
 
 
+# === ЛЕНТА ИЗМЕНЕНИЙ ===
+
+@app.get("/api/events")
+async def change_feed(request: Request, last_event_id: Optional[int] = None):
+    """SSE-поток изменений строк (insert/update/delete) для всех таблиц"""
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+
+    issued_id = None
+    if last_event_id is not None:
+        issued_id = await run_in_threadpool(broker.issued_id)
+    sub, missed = broker.subscribe(last_event_id, issued_id)
+    return StreamingResponse(
+        event_stream(broker, sub, missed, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/events/last-id")
+def get_last_event_id():
+    """Точка возобновления ленты: запрашивается до загрузки данных клиентом"""
+    return {"last_event_id": broker.issued_id()}
+
+
+# === ИНКРЕМЕНТАЛЬНАЯ СИНХРОНИЗАЦИЯ ===
+
+@app.get("/api/sync", response_model=schemas.SyncResponse)
+def sync_changes(since: Optional[str] = None, db: Session = Depends(get_db)):
+    """Строки, измененные и удаленные после токена since (без токена - все данные)"""
+    try:
+        revision = parse_token(since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return get_changes(db, revision)
+
+
+# === СЕТКИ РАСПИСАНИЯ ===
+
+@app.get("/api/timetable/group/{group_id}")
+def get_group_timetable(group_id: int, db: Session = Depends(get_db)):
+    """Готовая недельная сетка группы"""
+    timetable.ensure_loaded(db)
+    body = timetable.group_body(group_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Группа не найдена")
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/api/timetable/room/{room}")
+def get_room_timetable(room: str, db: Session = Depends(get_db)):
+    """Готовая недельная сетка аудитории"""
+    timetable.ensure_loaded(db)
+    return Response(content=timetable.room_body(room), media_type="application/json")
+
+
+# === СТАТИСТИКА ===
+
+@app.get("/api/stats/groups", response_model=List[schemas.GroupStats])
+def get_group_stats(db: Session = Depends(get_db)):
+    """Численность групп и количество пар в неделю"""
+    return stats_cache.get('groups', lambda: group_stats(db))
+
+
+@app.get("/api/stats/subjects", response_model=List[schemas.SubjectStats])
+def get_subject_stats(db: Session = Depends(get_db)):
+    """Количество пар по предметам"""
+    return stats_cache.get('subjects', lambda: subject_stats(db))
+
+
+@app.get("/api/stats/rooms", response_model=List[schemas.RoomStats])
+def get_room_stats(db: Session = Depends(get_db)):
+    """Загрузка аудиторий в процентах"""
+    return stats_cache.get('rooms', lambda: room_stats(db))
+
+
+@app.get("/api/stats/rooms/{room}/free", response_model=schemas.RoomFreeSlots)
+def get_room_free_slots(room: str, db: Session = Depends(get_db)):
+    """Свободные пары в аудитории"""
+    return stats_cache.get(('free', room), lambda: room_free_slots(db, room))
+
+
 # HTML страница
 @app.get("/")
-async def root():
-    with open("index.html", "r", encoding="utf-8") as f:
-        return HTMLResponse(content=f.read())
+async def root(request: Request):
+    return await static_assets.index_response(request)
+
+
+@app.get("/static/{name}")
+async def static_file(name: str, request: Request):
+    response = await static_assets.asset_response(request, name)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    return response
 
 
 # === ЭКСПОРТ ДОКУМЕНТОВ ===
 
-@app.get("/api/export/student/{student_id}/certificate-word")
-def export_student_certificate_word(student_id: int, db: Session = Depends(get_db)):
-    """Экспорт справки студента в Word"""
-    student = db.query(models.Student).filter(models.Student.id == student_id).first()
-    if not student:
-        raise HTTPException(status_code=404, detail="Студент не найден")
+# Одинаковые одновременные запросы экспорта формируют документ один раз
+export_flight = SingleFlight()
+client_limiter = RateLimiter(CLIENT_BURST, CLIENT_RATE)
+route_limiter = RateLimiter(ROUTE_BURST, ROUTE_RATE)
+
+
+def _too_many_requests(e):
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+
+async def export_rate_limit(request: Request):
+    """Лимит запросов экспорта на клиента для каждого маршрута"""
+    route = request.scope.get("route")
+    client = request.client.host if request.client else "unknown"
+    try:
+        client_limiter.check((client, route.path if route else request.url.path))
+    except RateLimitExceeded as e:
+        raise _too_many_requests(e)
 
-    group_name = None
-    if student.group_id:
-        group = db.query(models.Group).filter(models.Group.id == student.group_id).first()
-        group_name = group.name if group else None
 
-    buffer = create_student_certificate(student, group_name)
+async def render_export(route, key, render):
+    """Формирование документа с объединением одинаковых запросов.
 
+    render выполняется в пуле потоков только для первого запроса со своей
+    сессией БД и возвращает (содержимое, имя файла). Лимит маршрута
+    тратится только на новое формирование: клиенты, пришедшие во время
+    уже идущего, ждут его результат в цикле событий.
+    """
+    def limited_render():
+        route_limiter.check(route)
+        db = SessionLocal()
+        try:
+            return render(db)
+        finally:
+            db.close()
+
+    try:
+        return await export_flight.do((route, key), limited_render)
+    except RateLimitExceeded as e:
+        raise _too_many_requests(e)
+
+
+def _attachment_headers(filename):
     # Безопасное имя файла без русских символов
-    filename = f"certificate_{student.surname}_{student.name}.docx"
     safe_filename = urllib.parse.quote(filename)
-
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={
-            "Content-Disposition": f"attachment; filename={safe_filename}; filename*=UTF-8''{safe_filename}"
-        }
-    )
+    return {
+        "Content-Disposition": f"attachment; filename={safe_filename}; filename*=UTF-8''{safe_filename}"
+    }
 
 
-@app.get("/api/export/student/{student_id}/certificate-pdf")
-def export_student_certificate_pdf(student_id: int, db: Session = Depends(get_db)):
-    """Экспорт справки студента в PDF"""
+def _student_with_group(db, student_id):
     student = db.query(models.Student).filter(models.Student.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Студент не найден")
@@ -221,48 +417,149 @@ def export_student_certificate_pdf(student_id: int, db: Session = Depends(get_db
     if student.group_id:
         group = db.query(models.Group).filter(models.Group.id == student.group_id).first()
         group_name = group.name if group else None
+    return student, group_name
 
-    buffer = create_student_certificate_pdf(student, group_name)
 
-    # Безопасное имя файла без русских символов
-    filename = f"certificate_{student.surname}_{student.name}.pdf"
-    safe_filename = urllib.parse.quote(filename)
+@app.get("/api/export/student/{student_id}/certificate-word", dependencies=[Depends(export_rate_limit)])
+async def export_student_certificate_word(student_id: int):
+    """Экспорт справки студента в Word"""
+    def render(db):
+        student, group_name = _student_with_group(db, student_id)
+        content = create_student_certificate(student, group_name).getvalue()
+        return content, f"certificate_{student.surname}_{student.name}.docx"
 
-    return StreamingResponse(
-        buffer,
+    content, filename = await render_export("certificate-word", student_id, render)
+
+    return Response(
+        content,
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        headers=_attachment_headers(filename)
+    )
+
+
+@app.get("/api/export/student/{student_id}/certificate-pdf", dependencies=[Depends(export_rate_limit)])
+async def export_student_certificate_pdf(student_id: int):
+    """Экспорт справки студента в PDF"""
+    def render(db):
+        student, group_name = _student_with_group(db, student_id)
+        content = create_student_certificate_pdf(student, group_name).getvalue()
+        return content, f"certificate_{student.surname}_{student.name}.pdf"
+
+    content, filename = await render_export("certificate-pdf", student_id, render)
+
+    return Response(
+        content,
         media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename={safe_filename}; filename*=UTF-8''{safe_filename}"
-        }
+        headers=_attachment_headers(filename)
     )
 
 
-@app.get("/api/export/schedule/{group_id}/excel")
-def export_schedule_excel(group_id: int, db: Session = Depends(get_db)):
+@app.get("/api/export/schedule/{group_id}/excel", dependencies=[Depends(export_rate_limit)])
+async def export_schedule_excel(group_id: int):
     """Экспорт расписания группы в Excel"""
-    group = db.query(models.Group).filter(models.Group.id == group_id).first()
-    if not group:
-        raise HTTPException(status_code=404, detail="Группа не найдена")
+    def render(db):
+        group = db.query(models.Group).filter(models.Group.id == group_id).first()
+        if not group:
+            raise HTTPException(status_code=404, detail="Группа не найдена")
 
-    schedules = db.query(models.Schedule).filter(models.Schedule.group_id == group_id).all()
-    subjects = db.query(models.Subject).all()
-    subjects_dict = {s.id: s.name for s in subjects}
+        schedules = db.query(models.Schedule).filter(models.Schedule.group_id == group_id).all()
+        subjects = db.query(models.Subject).all()
+        subjects_dict = {s.id: s.name for s in subjects}
+        content = create_schedule_excel(group, schedules, subjects_dict).getvalue()
+        return content, f"schedule_{group.name}.xlsx"
 
-    buffer = create_schedule_excel(group, schedules, subjects_dict)
+    content, filename = await render_export("schedule-excel", group_id, render)
 
-    # Безопасное имя файла без русских символов
-    filename = f"schedule_{group.name}.xlsx"
-    safe_filename = urllib.parse.quote(filename)
-
-    return StreamingResponse(
-        buffer,
+    return Response(
+        content,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f"attachment; filename={safe_filename}; filename*=UTF-8''{safe_filename}"
-        }
+        headers=_attachment_headers(filename)
+    )
+
+
+@app.get("/api/export/group/{group_id}/certificates-pdf", dependencies=[Depends(export_rate_limit)])
+async def export_group_certificates_pdf(group_id: int):
+    """Справки всех студентов группы одним PDF для печати.
+
+    Группа больше LARGE_JOB_THRESHOLD студентов не формируется внутри запроса
+    (прокси оборвет его по таймауту): она ставится в фоновую очередь, и вместо
+    файла возвращается задача (202) со ссылкой на ее состояние в Location.
+    """
+    def render(db):
+        group = db.query(models.Group).filter(models.Group.id == group_id).first()
+        if not group:
+            raise HTTPException(status_code=404, detail="Группа не найдена")
+
+        students = (
+            db.query(models.Student)
+            .filter(models.Student.group_id == group_id)
+            .order_by(models.Student.surname, models.Student.name)
+            .all()
+        )
+        if not students:
+            raise HTTPException(status_code=404, detail="В группе нет студентов")
+
+        if len(students) > LARGE_JOB_THRESHOLD:
+            job = enqueue_job(db, "group_certificates", group_id=group_id, fmt="pdf")
+            return None, None, _job_response(job).model_dump(mode="json")
+
+        content = create_certificates_pdf(students, {group.id: group.name}, io.BytesIO()).getvalue()
+        return content, f"certificates_{group.name}.pdf", None
+
+    content, filename, job = await render_export("certificates-pdf-batch", group_id, render)
+    if job is not None:
+        return JSONResponse(job, status_code=202, headers={"Location": f"/api/jobs/{job['id']}"})
+
+    return Response(
+        content,
+        media_type="application/pdf",
+        headers=_attachment_headers(filename)
     )
 
 
+# === ФОНОВЫЙ ЭКСПОРТ ===
+
+def _job_response(job):
+    result = schemas.ExportJob.model_validate(job)
+    if job.status == 'done':
+        result.download_url = f"/api/jobs/{job.id}/download"
+    return result
+
+
+@app.post("/api/jobs/export", response_model=schemas.ExportJob, status_code=202)
+def create_export_job(job: schemas.ExportJobCreate, db: Session = Depends(get_db)):
+    """Постановка большого экспорта в очередь"""
+    try:
+        db_job = enqueue_job(db, job.kind, group_id=job.group_id, fmt=job.format, priority=job.priority)
+    except JobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _job_response(db_job)
+
+
+@app.get("/api/jobs/{job_id}", response_model=schemas.ExportJob)
+def get_export_job(job_id: int, db: Session = Depends(get_db)):
+    """Состояние и прогресс задачи экспорта"""
+    db_job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+    if not db_job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return _job_response(db_job)
+
+
+@app.get("/api/jobs/{job_id}/download")
+def download_export_job(job_id: int, db: Session = Depends(get_db)):
+    """Скачивание готового результата задачи"""
+    db_job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+    if not db_job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    if db_job.status == 'expired':
+        raise HTTPException(status_code=410, detail="Срок хранения результата истек")
+    if db_job.status == 'failed':
+        raise HTTPException(status_code=409, detail=f"Экспорт завершился ошибкой: {db_job.error}")
+    if db_job.status != 'done':
+        raise HTTPException(status_code=409, detail="Экспорт еще не готов")
+    return FileResponse(db_job.result_path, media_type=db_job.media_type, filename=db_job.filename)
+
+
 if __name__ == "__main__":
     import uvicorn
 
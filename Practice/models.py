@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Boolean, DateTime
+from datetime import datetime
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -12,6 +13,7 @@ class Student(Base):
     group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)
     email = Column(String, nullable=True)
     phone = Column(String, nullable=True)
+    revision = Column(BigInteger, nullable=False, default=0, index=True)
 
     group = relationship("Group", back_populates="students")
 
@@ -22,6 +24,7 @@ class Group(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)
     description = Column(String, nullable=True)
+    revision = Column(BigInteger, nullable=False, default=0, index=True)
 
     students = relationship("Student", back_populates="group")
     schedules = relationship("Schedule", back_populates="group")
@@ -33,6 +36,7 @@ class Subject(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     description = Column(String, nullable=True)
+    revision = Column(BigInteger, nullable=False, default=0, index=True)
 
     schedules = relationship("Schedule", back_populates="subject")
 
@@ -46,6 +50,44 @@ class Schedule(Base):
     day_of_week = Column(String, nullable=False)
     lesson_number = Column(Integer, nullable=False)
     room = Column(String, nullable=True)
+    revision = Column(BigInteger, nullable=False, default=0, index=True)
 
     group = relationship("Group", back_populates="schedules")
-    subject = relationship("Subject", back_populates="schedules")
\ No newline at end of file
+    subject = relationship("Subject", back_populates="schedules")
+
+
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    params = Column(String, nullable=True)  # JSON с параметрами экспорта
+    status = Column(String, nullable=False, default="queued", index=True)
+    priority = Column(Integer, nullable=False, default=0)
+    is_large = Column(Boolean, nullable=False, default=False)
+    progress = Column(Integer, nullable=False, default=0)  # проценты 0-100
+    result_path = Column(String, nullable=True)
+    filename = Column(String, nullable=True)
+    media_type = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # продлевается воркером во время работы
+    finished_at = Column(DateTime, nullable=True)
+
+
+class SyncState(Base):
+    __tablename__ = "sync_state"
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(BigInteger, nullable=False, default=0)
+
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    revision = Column(BigInteger, nullable=False, index=True)
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+# Лимит на клиента для каждого маршрута экспорта: запас запросов и пополнение в секунду
+CLIENT_BURST = 10
+CLIENT_RATE = 0.5
+
+# Лимит на маршрут: сколько новых формирований документа можно запустить.
+# Запросы, присоединившиеся к уже идущему формированию, его не тратят.
+ROUTE_BURST = 20
+ROUTE_RATE = 5.0
+
+# При таком количестве корзин из памяти удаляются давно не использованные
+MAX_BUCKETS = 10000
+BUCKET_IDLE_SECONDS = 600
+
+
+class RateLimitExceeded(Exception):
+    """Лимит запросов исчерпан"""
+
+    def __init__(self, retry_after):
+        super().__init__("Слишком много запросов")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Корзина токенов: capacity - максимальный всплеск, rate - токенов в секунду"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Берет токен. Возвращает 0 или сколько секунд ждать до следующего"""
+        # now может быть снят чуть раньше создания корзины
+        elapsed = max(now - self.updated, 0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(self.updated, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Набор корзин токенов по ключу (клиент, маршрут и т.п.)"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def check(self, key):
+        """Бросает RateLimitExceeded, если для ключа не осталось токенов"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= MAX_BUCKETS:
+                    self._prune(now)
+                bucket = TokenBucket(self.capacity, self.rate)
+                self.buckets[key] = bucket
+            retry_after = bucket.take(now)
+        if retry_after:
+            raise RateLimitExceeded(retry_after)
+
+    def _prune(self, now):
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if now - bucket.updated < BUCKET_IDLE_SECONDS
+        }
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных вызовов.
+
+    Первый запрос с данным ключом запускает функцию в пуле потоков,
+    остальные ждут ту же задачу в цикле событий (не занимая потоков)
+    и получают тот же результат (или ту же ошибку). Вызывать только
+    из цикла событий.
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, fn):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(fn))
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        # Отключение одного из клиентов не должно отменять общую задачу
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()  # ошибка уже передана ждущим, не логировать ее повторно
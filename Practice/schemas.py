@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
+from datetime import datetime
 
 
 # Student schemas
@@ -73,4 +74,71 @@ class Schedule(ScheduleBase):
     id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# Export job schemas
+class ExportJobCreate(BaseModel):
+    kind: str
+    group_id: Optional[int] = None
+    format: Optional[str] = "pdf"
+    priority: Optional[int] = None
+
+
+class ExportJob(BaseModel):
+    id: int
+    kind: str
+    status: str
+    priority: int
+    is_large: bool
+    progress: int
+    filename: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    download_url: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+# Sync schemas
+class SyncResponse(BaseModel):
+    token: str
+    changed: Dict[str, List[Dict[str, Any]]] = {}
+    deleted: Dict[str, List[int]] = {}
+
+
+# Stats schemas
+class GroupStats(BaseModel):
+    group_id: int
+    name: str
+    students: int
+    lessons: int
+    rank: int
+
+
+class SubjectStats(BaseModel):
+    subject_id: int
+    name: str
+    lessons: int
+    groups: int
+
+
+class RoomStats(BaseModel):
+    room: str
+    occupied_slots: int
+    free_slots: int
+    conflicts: int
+    utilization: float
+
+
+class Slot(BaseModel):
+    day_of_week: str
+    lesson_number: int
+
+
+class RoomFreeSlots(BaseModel):
+    room: str
+    free: List[Slot]
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import re
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него отдаем gzip
+    brotli = None
+
+INDEX_PATH = 'index.html'
+STATIC_PREFIX = '/static/'
+
+# index.html всегда перепроверяется по ETag, а ресурсы с хешем в имени
+# не меняются никогда и кешируются на год
+INDEX_CACHE_CONTROL = 'no-cache'
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+STYLE_RE = re.compile(r'<style>(.*?)</style>', re.S)
+SCRIPT_RE = re.compile(r'<script>(.*?)</script>', re.S)
+
+# Порядок предпочтения при одинаковом q
+ENCODINGS = ('br', 'gzip', 'identity')
+
+
+def parse_accept_encoding(header):
+    """Словарь кодировка -> q из заголовка Accept-Encoding"""
+    weights = {}
+    for part in header.split(','):
+        name, *params = part.split(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    return weights
+
+
+class StaticAsset:
+    """Файл фронтенда в памяти вместе со сжатыми вариантами"""
+
+    def __init__(self, content, media_type, cache_control):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.etag = f'"{self.digest[:16]}"'
+        self.bodies = {'identity': content}
+
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) < len(content):
+            self.bodies['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(content, quality=11)
+            if len(compressed) < len(content):
+                self.bodies['br'] = compressed
+
+    def choose_encoding(self, accept_encoding):
+        """Кодировка с наибольшим q; q=0 запрещает кодировку.
+
+        identity без сжатия подходит всегда, но выигрывает у сжатых
+        вариантов, только если клиент явно дал ей больший вес.
+        """
+        weights = parse_accept_encoding(accept_encoding)
+        default = weights.get('*', 0.0)
+        best, best_q = 'identity', 0.0
+        for encoding in ENCODINGS:
+            if encoding not in self.bodies:
+                continue
+            q = weights.get(encoding, 0.0 if encoding == 'identity' else default)
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def matches(self, if_none_match):
+        """Совпадает ли ETag с одним из значений If-None-Match (слабое сравнение)"""
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*':
+                return True
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == self.etag:
+                return True
+        return False
+
+    def response(self, request: Request):
+        headers = {
+            'ETag': self.etag,
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if self.matches(request.headers.get('if-none-match', '')):
+            return Response(status_code=304, headers=headers)
+
+        encoding = self.choose_encoding(request.headers.get('accept-encoding', ''))
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(content=self.bodies[encoding], media_type=self.media_type, headers=headers)
+
+
+class StaticAssets:
+    """Фронтенд, подготовленный при запуске.
+
+    Встроенные в index.html стили и скрипт выносятся в отдельные файлы
+    с хешем содержимого в имени, чтобы браузер кешировал их надолго.
+    """
+
+    def __init__(self, index_path=INDEX_PATH):
+        self.index_path = index_path
+        self.index = None
+        self.assets = {}
+
+    def load(self):
+        """Чтение и сжатие файлов (блокирующее, вызывать вне цикла событий)"""
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            html = f.read()
+
+        assets = {}
+
+        def extract(regex, ext, media_type, make_tag):
+            nonlocal html
+            match = regex.search(html)
+            if not match:
+                return
+            asset = StaticAsset(match.group(1).encode('utf-8'), media_type, ASSET_CACHE_CONTROL)
+            name = f"app.{asset.digest[:10]}.{ext}"
+            assets[name] = asset
+            html = html[:match.start()] + make_tag(STATIC_PREFIX + name) + html[match.end():]
+
+        extract(STYLE_RE, 'css', 'text/css; charset=utf-8',
+                lambda url: f'<link rel="stylesheet" href="{url}">')
+        extract(SCRIPT_RE, 'js', 'application/javascript; charset=utf-8',
+                lambda url: f'<script src="{url}"></script>')
+
+        self.index = StaticAsset(html.encode('utf-8'), 'text/html; charset=utf-8', INDEX_CACHE_CONTROL)
+        self.assets = assets
+
+    async def ensure_loaded(self):
+        if self.index is None:
+            await run_in_threadpool(self.load)
+
+    async def index_response(self, request: Request):
+        await self.ensure_loaded()
+        return self.index.response(request)
+
+    async def asset_response(self, request: Request, name):
+        """Ответ для ресурса или None, если такого нет"""
+        await self.ensure_loaded()
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+        return asset.response(request)
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,162 @@
+import threading
+
+from sqlalchemy import func, distinct
+from sqlalchemy.orm import Session
+
+import models
+from timetable import DAYS, LESSONS_PER_DAY
+
+# Количество ячеек недельной сетки одной аудитории
+TOTAL_SLOTS = len(DAYS) * LESSONS_PER_DAY
+
+# Ограничение размера кеша (ключи свободных слотов зависят от аудитории из URL)
+MAX_CACHE_ENTRIES = 1000
+
+
+class RollupCache:
+    """Кеш готовых агрегатов, сбрасывается при любой записи в базу.
+
+    Номер поколения не дает сохранить результат, посчитанный
+    одновременно со сбросом (он мог уже устареть).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.values = {}
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.values:
+                return self.values[key]
+            generation = self.generation
+        value = compute()
+        with self.lock:
+            if generation == self.generation:
+                if len(self.values) >= MAX_CACHE_ENTRIES:
+                    self.values.clear()
+                self.values[key] = value
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.values.clear()
+
+    def apply_change(self, table, action, row):
+        """Сброс кеша по событию изменения строки"""
+        self.invalidate()
+
+
+stats_cache = RollupCache()
+
+
+def _occupied_slots(db: Session):
+    """Подзапрос: занятые ячейки сетки по аудиториям (накладки схлопываются)"""
+    return (
+        db.query(
+            models.Schedule.room.label('room'),
+            models.Schedule.day_of_week.label('day_of_week'),
+            models.Schedule.lesson_number.label('lesson_number'),
+            func.count(models.Schedule.id).label('lessons'),
+        )
+        .filter(
+            models.Schedule.room.isnot(None),
+            models.Schedule.day_of_week.in_(DAYS),
+            models.Schedule.lesson_number.between(1, LESSONS_PER_DAY),
+        )
+        .group_by(models.Schedule.room, models.Schedule.day_of_week, models.Schedule.lesson_number)
+    )
+
+
+def group_stats(db: Session):
+    """Численность групп и количество пар в неделю"""
+    headcounts = (
+        db.query(models.Student.group_id.label('group_id'), func.count(models.Student.id).label('students'))
+        .group_by(models.Student.group_id)
+        .subquery()
+    )
+    lessons = (
+        db.query(models.Schedule.group_id.label('group_id'), func.count(models.Schedule.id).label('lessons'))
+        .group_by(models.Schedule.group_id)
+        .subquery()
+    )
+    students = func.coalesce(headcounts.c.students, 0)
+
+    rows = (
+        db.query(
+            models.Group.id,
+            models.Group.name,
+            students.label('students'),
+            func.coalesce(lessons.c.lessons, 0).label('lessons'),
+            func.rank().over(order_by=students.desc()).label('rank'),
+        )
+        .outerjoin(headcounts, headcounts.c.group_id == models.Group.id)
+        .outerjoin(lessons, lessons.c.group_id == models.Group.id)
+        .order_by(models.Group.name)
+        .all()
+    )
+    return [
+        {'group_id': r.id, 'name': r.name, 'students': r.students, 'lessons': r.lessons, 'rank': r.rank}
+        for r in rows
+    ]
+
+
+def subject_stats(db: Session):
+    """Количество пар в неделю по предметам и число групп, где предмет идет"""
+    rows = (
+        db.query(
+            models.Subject.id,
+            models.Subject.name,
+            func.count(models.Schedule.id).label('lessons'),
+            func.count(distinct(models.Schedule.group_id)).label('groups'),
+        )
+        .outerjoin(models.Schedule, models.Schedule.subject_id == models.Subject.id)
+        .group_by(models.Subject.id, models.Subject.name)
+        .order_by(models.Subject.name)
+        .all()
+    )
+    return [
+        {'subject_id': r.id, 'name': r.name, 'lessons': r.lessons, 'groups': r.groups}
+        for r in rows
+    ]
+
+
+def room_stats(db: Session):
+    """Загрузка аудиторий: занятые ячейки сетки и процент использования"""
+    occupied = _occupied_slots(db).subquery()
+    rows = (
+        db.query(
+            occupied.c.room,
+            func.count().label('occupied'),
+            func.sum(occupied.c.lessons).label('lessons'),
+        )
+        .group_by(occupied.c.room)
+        .order_by(occupied.c.room)
+        .all()
+    )
+    return [
+        {
+            'room': r.room,
+            'occupied_slots': r.occupied,
+            'free_slots': TOTAL_SLOTS - r.occupied,
+            'conflicts': r.lessons - r.occupied,
+            'utilization': round(r.occupied * 100.0 / TOTAL_SLOTS, 1),
+        }
+        for r in rows
+    ]
+
+
+def room_free_slots(db: Session, room):
+    """Свободные ячейки сетки в аудитории"""
+    occupied = {
+        (r.day_of_week, r.lesson_number)
+        for r in _occupied_slots(db).filter(models.Schedule.room == room).all()
+    }
+    free = [
+        {'day_of_week': day, 'lesson_number': lesson}
+        for lesson in range(1, LESSONS_PER_DAY + 1)
+        for day in DAYS
+        if (day, lesson) not in occupied
+    ]
+    return {'room': room, 'free': free}
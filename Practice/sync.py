@@ -0,0 +1,152 @@
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.interfaces import ONETOMANY
+
+import models
+import schemas
+from database import SessionLocal
+
+# Таблицы, участвующие в синхронизации: модель и схема для ответа
+SYNC_TABLES = {
+    'students': (models.Student, schemas.Student),
+    'groups': (models.Group, schemas.Group),
+    'subjects': (models.Subject, schemas.Subject),
+    'schedules': (models.Schedule, schemas.Schedule),
+}
+
+SYNC_MODELS = tuple(model for model, _ in SYNC_TABLES.values())
+
+
+def ensure_sync_schema(engine):
+    """Добавляет колонку revision в уже существующие таблицы и строку счетчика.
+
+    create_all не меняет созданные ранее таблицы, поэтому для старой базы
+    колонку приходится добавлять вручную.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SYNC_TABLES:
+            columns = [c['name'] for c in inspector.get_columns(table)]
+            if 'revision' not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN revision BIGINT NOT NULL DEFAULT 0"))
+                conn.execute(text(f"CREATE INDEX ix_{table}_revision ON {table} (revision)"))
+
+        state = models.SyncState.__table__
+        if conn.execute(state.select().where(state.c.id == 1)).first() is None:
+            conn.execute(state.insert().values(id=1, revision=0))
+
+
+def _next_revision(session: Session):
+    """Номер ревизии для текущей транзакции (один на транзакцию).
+
+    UPDATE блокирует строку счетчика до конца транзакции, поэтому ревизии
+    фиксируются строго по порядку и клиент не пропустит строку, записанную
+    с меньшим номером позже.
+    """
+    if 'sync_revision' not in session.info:
+        state = models.SyncState.__table__
+        session.info['sync_revision'] = session.connection().execute(
+            state.update()
+            .where(state.c.id == 1)
+            .values(revision=state.c.revision + 1)
+            .returning(state.c.revision)
+        ).scalar()
+    return session.info['sync_revision']
+
+
+def _detached_children(session, obj):
+    """Строки, у которых flush обнулит ссылку на удаляемый obj.
+
+    Это происходит уже после before_flush, поэтому сами они в session.dirty
+    не попадают, и без явной отметки клиенты не узнали бы об изменении.
+    """
+    children = []
+    for rel in inspect(obj).mapper.relationships:
+        if rel.direction is not ONETOMANY or rel.cascade.delete:
+            continue
+        for child in getattr(obj, rel.key):
+            if isinstance(child, SYNC_MODELS) and child not in session.deleted:
+                children.append(child)
+    return children
+
+
+@event.listens_for(SessionLocal, 'before_flush')
+def _stamp_revisions(session, flush_context, instances):
+    """Проставляет ревизию измененным строкам и пишет надгробия удаленных"""
+    changed = [obj for obj in session.new if isinstance(obj, SYNC_MODELS)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, SYNC_MODELS) and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, SYNC_MODELS)]
+    for obj in deleted:
+        changed += _detached_children(session, obj)
+    if not changed and not deleted:
+        return
+
+    revision = _next_revision(session)
+    for obj in changed:
+        obj.revision = revision
+    for obj in deleted:
+        session.add(models.Tombstone(table_name=obj.__tablename__, row_id=obj.id, revision=revision))
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _remember_revision(session):
+    revision = session.info.pop('sync_revision', None)
+    if revision is not None:
+        session.info['committed_revision'] = revision
+
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _reset_revision(session):
+    session.info.pop('sync_revision', None)
+
+
+def committed_revision(session: Session):
+    """Ревизия последней зафиксированной в сессии транзакции (нужна для событий удаления)"""
+    return session.info.get('committed_revision')
+
+
+def parse_token(token):
+    """Токен синхронизации - номер последней полученной ревизии"""
+    if not token:
+        return 0
+    try:
+        since = int(token)
+    except ValueError:
+        raise ValueError("Некорректный токен синхронизации")
+    if since < 0:
+        raise ValueError("Некорректный токен синхронизации")
+    return since
+
+
+def get_changes(db: Session, since):
+    """Строки, измененные и удаленные после ревизии since.
+
+    Пустые таблицы в ответ не попадают, чтобы синхронизация после
+    небольшой правки занимала несколько байт.
+    """
+    # Верхняя граница фиксируется заранее: строки новее нее придут в следующий раз
+    current = db.query(models.SyncState.revision).filter(models.SyncState.id == 1).scalar() or 0
+
+    changed = {}
+    for table, (model, schema) in SYNC_TABLES.items():
+        query = db.query(model).filter(model.revision <= current)
+        if since:
+            # Строки из старой базы имеют ревизию 0 и приходят только при полной синхронизации
+            query = query.filter(model.revision > since)
+        rows = query.order_by(model.id).all()
+        if rows:
+            changed[table] = [schema.model_validate(row).model_dump() for row in rows]
+
+    deleted = {}
+    if since:
+        tombstones = (
+            db.query(models.Tombstone.table_name, models.Tombstone.row_id)
+            .filter(models.Tombstone.revision > since, models.Tombstone.revision <= current)
+            .order_by(models.Tombstone.id)
+            .all()
+        )
+        for table_name, row_id in tombstones:
+            deleted.setdefault(table_name, []).append(row_id)
+
+    return {'token': str(current), 'changed': changed, 'deleted': deleted}
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+
+# Тесты работают на отдельной SQLite, а не на рабочей базе PostgreSQL
+PRACTICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+sys.path.insert(0, PRACTICE_DIR)
+
+import pytest
+from fastapi.testclient import TestClient
+
+import models
+import sync  # noqa: F401 - регистрирует обработчики ревизий на SessionLocal
+from database import Base, engine, SessionLocal
+from sync import ensure_sync_schema
+
+
+@pytest.fixture
+def db():
+    """Сессия на чистой базе"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    ensure_sync_schema(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """HTTP-клиент приложения без фоновых воркеров (lifespan не запускается)"""
+    import main
+
+    monkeypatch.chdir(PRACTICE_DIR)
+    main.timetable.reset()
+    main.stats_cache.invalidate()
+    main.client_limiter.buckets.clear()
+    main.route_limiter.buckets.clear()
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def group(db):
+    group = models.Group(name='ИС-21')
+    db.add(group)
+    db.commit()
+    return group
+
+
+@pytest.fixture
+def subject(db):
+    subject = models.Subject(name='Математика')
+    db.add(subject)
+    db.commit()
+    return subject
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+
+from events import EventBroker, format_sse
+
+
+def drain(sub):
+    events = []
+    while not sub.queue.empty():
+        events.append(sub.queue.get_nowait())
+    return events
+
+
+def test_subscriber_receives_published_events():
+    broker = EventBroker()
+
+    async def main():
+        sub, missed = broker.subscribe()
+        broker.publish('groups', 'insert', {'id': 1})
+        await asyncio.sleep(0)
+        return missed, drain(sub)
+
+    missed, events = asyncio.run(main())
+    assert missed == []
+    assert [(e['id'], e['table'], e['action']) for e in events] == [(1, 'groups', 'insert')]
+
+
+def test_resume_from_last_event_id():
+    broker = EventBroker()
+    for i in range(3):
+        broker.publish('groups', 'update', {'id': i})
+
+    async def main():
+        return broker.subscribe(1)[1], broker.subscribe(3)[1]
+
+    missed, up_to_date = asyncio.run(main())
+    assert [e['id'] for e in missed] == [2, 3]
+    assert up_to_date == []
+
+
+def test_unknown_last_event_id_requires_reload():
+    broker = EventBroker()
+    broker.publish('groups', 'insert', {'id': 1})
+
+    async def main():
+        # Номер из будущего: сервер перезапускался
+        ahead = broker.subscribe(10)[1]
+        broker.resume_floor = 1
+        behind = broker.subscribe(0)[1]
+        return ahead, behind
+
+    assert asyncio.run(main()) == (None, None)
+
+
+def test_failing_listener_does_not_stop_others():
+    broker = EventBroker()
+    received = []
+
+    def broken(table, action, row):
+        raise RuntimeError('ошибка кеша')
+
+    broker.add_listener(broken)
+    broker.add_listener(lambda table, action, row: received.append((table, action, row['id'])))
+
+    broker.publish('subjects', 'delete', {'id': 7})
+    assert received == [('subjects', 'delete', 7)]
+
+
+def test_reset_notifies_caches_and_subscribers():
+    broker = EventBroker()
+    resets = []
+    broker.add_reset_listener(lambda: resets.append(1))
+
+    async def main():
+        sub, _ = broker.subscribe()
+        broker.reset()
+        await asyncio.sleep(0)
+        return drain(sub)
+
+    assert asyncio.run(main()) == [None]
+    assert resets == [1]
+
+
+def test_format_sse():
+    event = {'id': 3, 'table': 'groups', 'action': 'insert', 'row': {'id': 1, 'name': 'ИС-21'}}
+    text = format_sse(event)
+    assert text.startswith('id: 3\n')
+    assert 'ИС-21' in text
+    assert text.endswith('\n\n')
+
+
+def test_last_id_endpoint_follows_writes(client):
+    before = client.get('/api/events/last-id').json()['last_event_id']
+    client.post('/api/groups', json={'name': 'ИС-21'})
+    assert client.get('/api/events/last-id').json()['last_event_id'] == before + 1
+
+
+def test_feed_requests_reload_for_unknown_event_id(client):
+    last_id = client.get('/api/events/last-id').json()['last_event_id']
+    response = client.get('/api/events', headers={'Last-Event-ID': str(last_id + 100)})
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert 'event: reset' in response.text
+
+
+def test_group_delete_publishes_detached_students(client, monkeypatch):
+    import main
+
+    events = []
+    monkeypatch.setattr(main.broker, 'listeners', [lambda table, action, row: events.append((table, action, row))])
+    group = client.post('/api/groups', json={'name': 'ИС-21'}).json()
+    student = client.post('/api/students', json={'name': 'Иван', 'surname': 'Петров', 'group_id': group['id']}).json()
+    events.clear()
+
+    client.delete(f"/api/groups/{group['id']}")
+    assert [(table, action) for table, action, _ in events] == [('groups', 'delete'), ('students', 'update')]
+    row = events[1][2]
+    assert row['id'] == student['id']
+    assert row['group_id'] is None
+    assert row['revision'] == events[0][2]['revision']
+
+
+def test_concurrent_publishers_keep_id_order():
+    broker = EventBroker()
+
+    def writer():
+        for i in range(200):
+            broker.publish('groups', 'update', {'id': i})
+
+    async def main():
+        sub, _ = broker.subscribe()
+        sub.queue = asyncio.Queue()  # без ограничения, чтобы не сработал сброс
+        threads = [threading.Thread(target=writer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        await asyncio.sleep(0.1)
+        return [e['id'] for e in drain(sub)]
+
+    delivered = asyncio.run(main())
+    assert delivered == list(range(1, 1601))
+    assert [e['id'] for e in broker.history] == delivered[-len(broker.history):]
+
+
+def test_lagging_worker_skips_events_client_already_has():
+    broker = EventBroker()
+    broker.dispatch({'id': 5, 'table': 'groups', 'action': 'insert', 'row': {'id': 1}})
+
+    async def main():
+        # Клиент получил номер 8 от другого воркера; этот процесс видел только 5
+        sub, missed = broker.subscribe(8, issued_id=8)
+        for event_id in (6, 7, 8, 9):
+            broker.dispatch({'id': event_id, 'table': 'groups', 'action': 'update', 'row': {'id': 1}})
+        await asyncio.sleep(0)
+        return missed, [e['id'] for e in drain(sub)]
+
+    assert asyncio.run(main()) == ([], [9])
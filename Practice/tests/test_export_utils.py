@@ -0,0 +1,62 @@
+import io
+import re
+
+import pytest
+
+import jobs
+import models
+from conftest import PRACTICE_DIR
+from export_utils import create_certificates_pdf
+
+
+def page_count(pdf):
+    return len(re.findall(rb'/Type /Page\b(?!s)', pdf))
+
+
+def add_students(db, group, count):
+    db.add_all([models.Student(name=f'Студент{i}', surname='Иванов', group_id=group.id) for i in range(count)])
+    db.commit()
+
+
+@pytest.fixture
+def in_practice_dir(monkeypatch):
+    # Печать stamp.png ищется относительно рабочей папки
+    monkeypatch.chdir(PRACTICE_DIR)
+
+
+def test_batch_pdf_embeds_stamp_once(db, group, in_practice_dir):
+    add_students(db, group, 40)
+    students = db.query(models.Student).all()
+    pages = []
+
+    pdf = create_certificates_pdf(students, {group.id: group.name}, io.BytesIO(),
+                                  on_page=lambda done, total: pages.append(done)).getvalue()
+
+    assert page_count(pdf) == 40
+    assert pdf.count(b'/Subtype /Image') == 1
+    assert pages == list(range(1, 41))
+
+
+def test_group_certificates_endpoint(client, db, group):
+    add_students(db, group, 3)
+
+    response = client.get(f'/api/export/group/{group.id}/certificates-pdf')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/pdf'
+    assert page_count(response.content) == 3
+
+
+def test_large_group_is_sent_to_job_queue(client, db, group):
+    add_students(db, group, jobs.LARGE_JOB_THRESHOLD + 1)
+
+    response = client.get(f'/api/export/group/{group.id}/certificates-pdf')
+    assert response.status_code == 202
+    job = response.json()
+    assert response.headers['location'] == f"/api/jobs/{job['id']}"
+    assert job['kind'] == 'group_certificates'
+    assert job['status'] == 'queued'
+
+
+def test_group_certificates_endpoint_not_found(client, group):
+    assert client.get(f'/api/export/group/{group.id}/certificates-pdf').status_code == 404
+    assert client.get('/api/export/group/999/certificates-pdf').status_code == 404
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import jobs
+import models
+from jobs import (claim_next_job, recover_stale_jobs, purge_expired_results,
+                  JOB_LEASE, MAX_ATTEMPTS, RESULT_RETENTION)
+
+
+def add_job(db, **fields):
+    job = models.ExportJob(kind='all_schedules', params='{}', **fields)
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_claim_respects_priority_and_large_limit(db):
+    large = add_job(db, priority=5, is_large=True)
+    second_large = add_job(db, priority=5, is_large=True)
+    small = add_job(db, priority=1)
+
+    assert claim_next_job(db, max_large=1).id == large.id
+    # Одна большая задача уже идет, вторая ждет, пока маленькие разбираются
+    assert claim_next_job(db, max_large=1).id == small.id
+    assert claim_next_job(db, max_large=1) is None
+
+    db.refresh(second_large)
+    assert second_large.status == 'queued'
+    assert large.attempts == 1
+
+
+def test_recover_stale_jobs(db):
+    now = datetime.utcnow()
+    stale = add_job(db, status='running', attempts=1, heartbeat_at=now - JOB_LEASE * 2)
+    exhausted = add_job(db, status='running', attempts=MAX_ATTEMPTS, heartbeat_at=now - JOB_LEASE * 2)
+    alive = add_job(db, status='running', attempts=1, heartbeat_at=now)
+
+    assert recover_stale_jobs(db, now) == 2
+    assert stale.status == 'queued'
+    assert exhausted.status == 'failed'
+    assert alive.status == 'running'
+
+
+def test_purge_expired_results(db, tmp_path):
+    now = datetime.utcnow()
+    path = tmp_path / 'result.pdf'
+    path.write_bytes(b'%PDF')
+    old = add_job(db, status='done', result_path=str(path), finished_at=now - RESULT_RETENTION * 2)
+    fresh = add_job(db, status='done', result_path=str(path), finished_at=now)
+    failed = add_job(db, status='failed', error='нет шрифта', finished_at=now - RESULT_RETENTION * 2)
+
+    assert purge_expired_results(db, now) == 1
+    assert old.status == 'expired'
+    assert old.result_path is None
+    assert not path.exists()
+    assert fresh.status == 'done'
+    assert failed.status == 'failed'
+    assert failed.error == 'нет шрифта'
+
+
+def test_failed_job_download_reports_error(client, db):
+    job = add_job(db, status='failed', error='нет шрифта', finished_at=datetime.utcnow() - RESULT_RETENTION * 2)
+    purge_expired_results(db)
+
+    response = client.get(f'/api/jobs/{job.id}/download')
+    assert response.status_code == 409
+    assert 'нет шрифта' in response.json()['detail']
+
+
+def test_attempts_write_separate_temp_files(db, group, monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, 'EXPORT_DIR', str(tmp_path))
+    paths = []
+    runner = jobs.JOB_RUNNERS['group_schedule']
+
+    def recording_runner(db, params, path, report):
+        paths.append(path)
+        return runner(db, params, path, report)
+
+    monkeypatch.setitem(jobs.JOB_RUNNERS, 'group_schedule', recording_runner)
+    job = add_job(db, status='running', attempts=2)
+    job.kind = 'group_schedule'
+    job.params = f'{{"group_id": {group.id}}}'
+    db.commit()
+
+    jobs.run_job(db, job)
+    assert paths == [str(tmp_path / f'job_{job.id}_2.part')]
+    assert job.status == 'done'
+
+
+def test_export_job_endpoints(client, group, monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, 'EXPORT_DIR', str(tmp_path))
+
+    job = client.post('/api/jobs/export', json={'kind': 'group_schedule', 'group_id': group.id})
+    assert job.status_code == 202
+    job_id = job.json()['id']
+    assert job.json()['status'] == 'queued'
+    assert client.get(f'/api/jobs/{job_id}/download').status_code == 409
+
+    assert jobs.worker_pool.run_once()
+
+    status = client.get(f'/api/jobs/{job_id}').json()
+    assert status['status'] == 'done'
+    assert status['progress'] == 100
+    download = client.get(f'/api/jobs/{job_id}/download')
+    assert download.status_code == 200
+    assert download.content.startswith(b'PK')
+
+
+def test_export_job_rejects_unknown_group(client):
+    response = client.post('/api/jobs/export', json={'kind': 'group_schedule', 'group_id': 999})
+    assert response.status_code == 400
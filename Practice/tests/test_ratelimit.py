@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+
+from ratelimit import TokenBucket, RateLimiter, RateLimitExceeded, SingleFlight, CLIENT_BURST
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(capacity=2, rate=1.0)
+    now = bucket.updated
+    assert bucket.take(now) == 0
+    assert bucket.take(now) == 0
+    assert bucket.take(now) == pytest.approx(1.0)
+
+    assert bucket.take(now + 1.0) == 0
+    assert bucket.take(now + 1.0) > 0
+
+
+def test_token_bucket_does_not_exceed_capacity():
+    bucket = TokenBucket(capacity=2, rate=1.0)
+    now = bucket.updated + 100
+    assert bucket.take(now) == 0
+    assert bucket.take(now) == 0
+    assert bucket.take(now) > 0
+
+
+def test_rate_limiter_keys_are_independent():
+    limiter = RateLimiter(capacity=1, rate=0.001)
+    limiter.check('a')
+    with pytest.raises(RateLimitExceeded) as e:
+        limiter.check('a')
+    assert e.value.retry_after > 0
+    limiter.check('b')
+
+
+def test_single_flight_runs_function_once():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def render():
+        calls.append(1)
+        release.wait(5)
+        return b'document'
+
+    async def main():
+        requests = [asyncio.ensure_future(flight.do('key', render)) for _ in range(5)]
+        await asyncio.sleep(0.1)
+        release.set()
+        return await asyncio.gather(*requests)
+
+    assert asyncio.run(main()) == [b'document'] * 5
+    assert len(calls) == 1
+    assert flight.calls == {}
+
+
+def test_single_flight_shares_error_and_allows_retry():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError('ошибка формирования')
+
+    async def main():
+        results = await asyncio.gather(flight.do('key', fail), flight.do('key', fail),
+                                       return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        return await flight.do('key', lambda: 42)
+
+    assert asyncio.run(main()) == 42
+
+
+def test_single_flight_survives_cancelled_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def render():
+        release.wait(5)
+        return 'ok'
+
+    async def main():
+        first = asyncio.ensure_future(flight.do('key', render))
+        second = asyncio.ensure_future(flight.do('key', render))
+        await asyncio.sleep(0.1)
+        first.cancel()
+        release.set()
+        return await second
+
+    assert asyncio.run(main()) == 'ok'
+
+
+def test_export_endpoint_limits_client(client, group):
+    url = f'/api/export/schedule/{group.id}/excel'
+    statuses = [client.get(url).status_code for _ in range(CLIENT_BURST)]
+    assert statuses == [200] * CLIENT_BURST
+
+    response = client.get(url)
+    assert response.status_code == 429
+    assert int(response.headers['retry-after']) >= 1
+
+
+def test_export_endpoint_not_found(client):
+    assert client.get('/api/export/student/999/certificate-pdf').status_code == 404
@@ -0,0 +1,62 @@
+import re
+
+import pytest
+
+from static import StaticAsset, parse_accept_encoding
+
+
+@pytest.fixture
+def asset():
+    asset = StaticAsset(b'body { color: black; }\n' * 200, 'text/css', 'no-cache')
+    # Результат не должен зависеть от того, установлен ли brotli
+    asset.bodies['br'] = b'br'
+    return asset
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, br;q=0.5, *;q=0') == {'gzip': 1.0, 'br': 0.5, '*': 0.0}
+    assert parse_accept_encoding('') == {}
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', 'identity'),
+    ('gzip', 'gzip'),
+    ('gzip, br', 'br'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('br;q=0, gzip;q=0', 'identity'),
+    ('*', 'br'),
+    ('*;q=0', 'identity'),
+    ('gzip;q=0.5, identity', 'identity'),
+    ('gzip;q=bad', 'identity'),
+])
+def test_choose_encoding(asset, header, expected):
+    assert asset.choose_encoding(header) == expected
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', False),
+    ('*', True),
+    ('"other"', False),
+    ('"other", {etag}', True),
+    ('W/{etag}', True),
+])
+def test_if_none_match(asset, header, expected):
+    assert asset.matches(header.format(etag=asset.etag)) is expected
+
+
+def test_index_and_assets_served_with_caching(client):
+    index = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert index.status_code == 200
+    assert index.headers['content-encoding'] == 'gzip'
+    assert index.headers['cache-control'] == 'no-cache'
+    assert '<style>' not in index.text
+
+    not_modified = client.get('/', headers={'If-None-Match': index.headers['etag']})
+    assert not_modified.status_code == 304
+
+    [script] = re.findall(r'src="(/static/app\.[0-9a-f]+\.js)"', index.text)
+    asset = client.get(script, headers={'Accept-Encoding': 'identity'})
+    assert asset.status_code == 200
+    assert 'immutable' in asset.headers['cache-control']
+    assert 'content-encoding' not in asset.headers
+    assert client.get('/static/missing.js').status_code == 404
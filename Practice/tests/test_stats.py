@@ -0,0 +1,76 @@
+import models
+from stats import RollupCache, group_stats, room_stats, room_free_slots, TOTAL_SLOTS
+
+
+def test_rollup_cache_returns_cached_value():
+    cache = RollupCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get('groups', compute) == 1
+    assert cache.get('groups', compute) == 1
+    cache.invalidate()
+    assert cache.get('groups', compute) == 2
+
+
+def test_rollup_cache_drops_value_computed_during_invalidate():
+    cache = RollupCache()
+
+    def compute():
+        # Запись в базу пришла, пока агрегат считался
+        cache.invalidate()
+        return 'stale'
+
+    assert cache.get('groups', compute) == 'stale'
+    assert 'groups' not in cache.values
+    assert cache.get('groups', lambda: 'fresh') == 'fresh'
+
+
+def test_rollup_cache_invalidated_by_change_event():
+    cache = RollupCache()
+    cache.get('groups', lambda: 1)
+    cache.apply_change('students', 'insert', {'id': 1})
+    assert cache.values == {}
+
+
+def test_group_and_room_stats(db, group, subject):
+    db.add_all([
+        models.Student(name='Иван', surname='Петров', group_id=group.id),
+        models.Schedule(group_id=group.id, subject_id=subject.id,
+                        day_of_week='Понедельник', lesson_number=1, room='101'),
+        models.Schedule(group_id=group.id, subject_id=subject.id,
+                        day_of_week='Понедельник', lesson_number=1, room='101'),
+        models.Schedule(group_id=group.id, subject_id=subject.id,
+                        day_of_week='Вторник', lesson_number=2, room='101'),
+    ])
+    db.commit()
+
+    assert group_stats(db) == [
+        {'group_id': group.id, 'name': 'ИС-21', 'students': 1, 'lessons': 3, 'rank': 1}
+    ]
+
+    [room] = room_stats(db)
+    assert room['occupied_slots'] == 2
+    assert room['free_slots'] == TOTAL_SLOTS - 2
+    assert room['conflicts'] == 1
+
+    free = room_free_slots(db, '101')['free']
+    assert len(free) == TOTAL_SLOTS - 2
+    assert {'day_of_week': 'Понедельник', 'lesson_number': 1} not in free
+
+
+def test_stats_endpoints(client, group, subject):
+    client.post('/api/students', json={'name': 'Иван', 'surname': 'Петров', 'group_id': group.id})
+    assert client.get('/api/stats/groups').json()[0]['students'] == 1
+
+    client.post('/api/schedule', json={'group_id': group.id, 'subject_id': subject.id,
+                                       'day_of_week': 'Среда', 'lesson_number': 3, 'room': '205'})
+    # Запись сбрасывает кеш, следующий запрос видит новые данные
+    assert client.get('/api/stats/groups').json()[0]['lessons'] == 1
+    assert client.get('/api/stats/subjects').json()[0]['groups'] == 1
+    assert client.get('/api/stats/rooms').json()[0]['occupied_slots'] == 1
+    free = client.get('/api/stats/rooms/205/free').json()['free']
+    assert {'day_of_week': 'Среда', 'lesson_number': 3} not in free
@@ -0,0 +1,108 @@
+import pytest
+
+import models
+from sync import get_changes, parse_token, committed_revision
+
+
+def current_revision(db):
+    return db.query(models.SyncState.revision).scalar()
+
+
+def test_one_revision_per_transaction(db):
+    group = models.Group(name='ИС-21')
+    subject = models.Subject(name='Математика')
+    db.add_all([group, subject])
+    db.flush()
+    db.add(models.Student(name='Иван', surname='Петров', group_id=group.id))
+    db.commit()
+
+    revisions = {row.revision for row in db.query(models.Group).all()}
+    revisions |= {row.revision for row in db.query(models.Subject).all()}
+    revisions |= {row.revision for row in db.query(models.Student).all()}
+    assert revisions == {1}
+    assert current_revision(db) == 1
+    assert committed_revision(db) == 1
+
+
+def test_unchanged_values_do_not_bump_revision(db, group):
+    group.name = group.name
+    db.commit()
+    assert current_revision(db) == 1
+
+    group.description = 'Информационные системы'
+    db.commit()
+    assert current_revision(db) == 2
+    assert group.revision == 2
+
+
+def test_full_sync_returns_rows_without_tombstones(db, group, subject):
+    db.delete(subject)
+    db.commit()
+
+    changes = get_changes(db, 0)
+    assert changes['token'] == '3'
+    assert [row['id'] for row in changes['changed']['groups']] == [group.id]
+    assert 'subjects' not in changes['changed']
+    assert changes['deleted'] == {}
+
+
+def test_incremental_sync_returns_changes_after_token(db, group, subject):
+    token = parse_token(get_changes(db, 0)['token'])
+
+    group.name = 'ИС-22'
+    subject_id = subject.id
+    db.delete(subject)
+    db.commit()
+
+    changes = get_changes(db, token)
+    assert [row['name'] for row in changes['changed']['groups']] == ['ИС-22']
+    assert changes['deleted'] == {'subjects': [subject_id]}
+
+    assert get_changes(db, int(changes['token'])) == {'token': changes['token'], 'changed': {}, 'deleted': {}}
+
+
+def test_sync_ignores_rows_above_current_revision(db, group):
+    # Строка, чья транзакция еще не отразилась в счетчике, придет в следующий раз
+    db.query(models.Group).update({models.Group.revision: 5})
+    db.commit()
+
+    assert get_changes(db, 0)['changed'] == {}
+
+
+@pytest.mark.parametrize('token', ['abc', '-1'])
+def test_parse_token_rejects_invalid(token):
+    with pytest.raises(ValueError):
+        parse_token(token)
+
+
+def test_parse_token_empty_means_full_sync():
+    assert parse_token(None) == 0
+    assert parse_token('') == 0
+    assert parse_token('7') == 7
+
+
+def test_sync_endpoint(client):
+    group = client.post('/api/groups', json={'name': 'ИС-21'}).json()
+    full = client.get('/api/sync').json()
+    assert [row['id'] for row in full['changed']['groups']] == [group['id']]
+
+    client.delete(f"/api/groups/{group['id']}")
+    delta = client.get('/api/sync', params={'since': full['token']}).json()
+    assert delta['changed'] == {}
+    assert delta['deleted'] == {'groups': [group['id']]}
+
+    assert client.get('/api/sync', params={'since': 'abc'}).status_code == 400
+
+
+def test_deleting_group_stamps_detached_students(db, group):
+    student = models.Student(name='Иван', surname='Петров', group_id=group.id)
+    db.add(student)
+    db.commit()
+    token = int(get_changes(db, 0)['token'])
+
+    db.delete(group)
+    db.commit()
+
+    changes = get_changes(db, token)
+    assert [(row['id'], row['group_id']) for row in changes['changed']['students']] == [(student.id, None)]
+    assert changes['deleted'] == {'groups': [group.id]}
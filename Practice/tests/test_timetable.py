@@ -0,0 +1,131 @@
+import json
+
+import pytest
+
+import models
+from timetable import TimetableStore, slot_index
+
+
+def schedule_row(schedule_id, group_id, subject_id, day='Понедельник', lesson=1, room='101', revision=None):
+    return {'id': schedule_id, 'group_id': group_id, 'subject_id': subject_id,
+            'day_of_week': day, 'lesson_number': lesson, 'room': room, 'revision': revision}
+
+
+@pytest.fixture
+def store(db, group, subject):
+    store = TimetableStore()
+    store.ensure_loaded(db)
+    return store
+
+
+def group_cells(store, group_id):
+    return json.loads(store.group_body(group_id))['cells']
+
+
+def test_slot_index():
+    assert slot_index('Понедельник', 1) == 0
+    assert slot_index('Вторник', 2) == 7
+    assert slot_index('Воскресенье', 1) is None
+    assert slot_index('Понедельник', 5) is None
+
+
+def test_grid_built_from_database(db, group, subject):
+    db.add(models.Schedule(group_id=group.id, subject_id=subject.id,
+                           day_of_week='Среда', lesson_number=2, room='202'))
+    db.commit()
+    store = TimetableStore()
+    store.ensure_loaded(db)
+
+    cells = group_cells(store, group.id)
+    assert [e['subject'] for e in cells[1][2]] == ['Математика']
+    assert json.loads(store.room_body('202'))['cells'][1][2][0]['group'] == 'ИС-21'
+    assert store.group_body(group.id + 100) is None
+
+
+def test_incremental_insert_update_delete(store, group, subject):
+    store.apply_change('schedules', 'insert', schedule_row(1, group.id, subject.id))
+    assert group_cells(store, group.id)[0][0][0]['room'] == '101'
+
+    store.apply_change('schedules', 'update', schedule_row(1, group.id, subject.id, day='Пятница', room='303'))
+    cells = group_cells(store, group.id)
+    assert cells[0][0] == []
+    assert cells[0][4][0]['room'] == '303'
+    assert json.loads(store.room_body('101'))['cells'][0][0] == []
+
+    store.apply_change('schedules', 'delete', {'id': 1})
+    assert group_cells(store, group.id)[0][4] == []
+    assert '303' not in store.room_grids
+
+
+def test_double_booking_listed_in_cell(store, group, subject):
+    store.apply_change('schedules', 'insert', schedule_row(2, group.id, subject.id))
+    store.apply_change('schedules', 'insert', schedule_row(1, group.id, subject.id))
+
+    body = json.loads(store.room_body('101'))
+    assert [e['id'] for e in body['cells'][0][0]] == [1, 2]
+    assert body['conflicts'] == 1
+
+
+def test_rename_subject_updates_cells(store, group, subject):
+    store.apply_change('schedules', 'insert', schedule_row(1, group.id, subject.id))
+    store.apply_change('subjects', 'update', {'id': subject.id, 'name': 'Физика'})
+    assert group_cells(store, group.id)[0][0][0]['subject'] == 'Физика'
+
+
+def test_stale_revision_ignored(store, group, subject):
+    store.apply_change('schedules', 'insert', schedule_row(1, group.id, subject.id, room='101', revision=5))
+    store.apply_change('schedules', 'update', schedule_row(1, group.id, subject.id, room='999', revision=4))
+    assert group_cells(store, group.id)[0][0][0]['room'] == '101'
+
+    store.apply_change('schedules', 'delete', {'id': 1, 'revision': 6})
+    store.apply_change('schedules', 'update', schedule_row(1, group.id, subject.id, revision=5))
+    assert group_cells(store, group.id)[0][0] == []
+
+
+def test_reset_rebuilds_from_database(db, store, group, subject):
+    store.apply_change('schedules', 'insert', schedule_row(99, group.id, subject.id))
+    store.reset()
+    store.ensure_loaded(db)
+    assert group_cells(store, group.id)[0][0] == []
+
+
+def test_timetable_endpoints(client, group, subject):
+    for _ in range(2):
+        client.post('/api/schedule', json={'group_id': group.id, 'subject_id': subject.id,
+                                           'day_of_week': 'Понедельник', 'lesson_number': 1, 'room': '101'})
+
+    body = client.get(f'/api/timetable/group/{group.id}').json()
+    assert [e['subject'] for e in body['cells'][0][0]] == ['Математика', 'Математика']
+    assert body['conflicts'] == 1
+
+    room = client.get('/api/timetable/room/101').json()
+    assert len(room['cells'][0][0]) == 2
+    assert client.get('/api/timetable/group/999').status_code == 404
+
+
+def test_write_updates_caches_once(client):
+    import main
+
+    generation = main.stats_cache.generation
+    client.post('/api/groups', json={'name': 'ИС-21'})
+    assert main.stats_cache.generation == generation + 1
+
+
+def test_cache_error_does_not_fail_committed_write(client, monkeypatch):
+    import main
+
+    def broken(table, action, row):
+        raise RuntimeError('ошибка кеша')
+
+    monkeypatch.setattr(main.broker, 'listeners', [broken])
+    assert client.post('/api/groups', json={'name': 'ИС-21'}).status_code == 200
+
+    def broken_publish(table, action, row):
+        raise RuntimeError('лента недоступна')
+
+    resets = []
+    monkeypatch.setattr(main.broker, 'publish', broken_publish)
+    monkeypatch.setattr(main.broker, 'reset_listeners', [lambda: resets.append(1)])
+    assert client.post('/api/groups', json={'name': 'ИС-22'}).status_code == 200
+    assert resets == [1]
+    assert len(client.get('/api/groups').json()) == 2
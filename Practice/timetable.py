@@ -0,0 +1,223 @@
+import json
+import threading
+
+from sqlalchemy.orm import Session
+
+import models
+
+# Сетка расписания: дни недели и пары, как в интерфейсе и в Excel
+DAYS = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
+LESSONS_PER_DAY = 4
+
+
+def slot_index(day_of_week, lesson_number):
+    """Номер ячейки в плоском массиве сетки или None, если занятие вне сетки"""
+    if day_of_week not in DAYS or not 1 <= lesson_number <= LESSONS_PER_DAY:
+        return None
+    return (lesson_number - 1) * len(DAYS) + DAYS.index(day_of_week)
+
+
+class TimetableGrid:
+    """Недельная сетка одной группы или аудитории.
+
+    Ячейки хранятся в плоском списке (пары x дни). В ячейке список занятий:
+    обычно одно, несколько - только при накладках в расписании.
+    Готовый JSON кешируется и сбрасывается при любом изменении сетки.
+    """
+
+    def __init__(self, header):
+        self.header = header
+        self.slots = [[] for _ in range(LESSONS_PER_DAY * len(DAYS))]
+        self.count = 0
+        self._body = None
+
+    def add(self, index, entry):
+        self.slots[index].append(entry)
+        self.count += 1
+        self._body = None
+
+    def remove(self, index, schedule_id):
+        self.slots[index] = [e for e in self.slots[index] if e['id'] != schedule_id]
+        self.count -= 1
+        self._body = None
+
+    def invalidate(self):
+        self._body = None
+
+    def body(self):
+        """JSON-представление сетки: строки - пары, колонки - дни.
+
+        Ячейка - список занятий; больше одного занятия означает накладку,
+        их число по всей сетке отдается в поле conflicts.
+        """
+        if self._body is None:
+            cells = []
+            conflicts = 0
+            for lesson in range(LESSONS_PER_DAY):
+                row = []
+                for day in range(len(DAYS)):
+                    slot = sorted(self.slots[lesson * len(DAYS) + day], key=lambda e: e['id'])
+                    conflicts += max(len(slot) - 1, 0)
+                    row.append(slot)
+                cells.append(row)
+            data = dict(self.header, days=DAYS, lessons=LESSONS_PER_DAY, conflicts=conflicts, cells=cells)
+            self._body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        return self._body
+
+
+class TimetableStore:
+    """Материализованные сетки расписания по группам и аудиториям.
+
+    Строится из базы при первом чтении, дальше поддерживается
+    инкрементально через apply_change() из обработчиков CRUD и ленты изменений.
+    Повторное применение одного и того же изменения ничего не портит, а
+    изменение с ревизией старше уже примененной (уведомления разных воркеров
+    могут прийти не в порядке фиксации) отбрасывается.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.subject_names = {}
+        self.group_names = {}
+        self.entries = {}       # schedule_id -> (entry, slot)
+        self.group_grids = {}   # group_id -> TimetableGrid
+        self.room_grids = {}    # room -> TimetableGrid
+        self.revisions = {}     # (таблица, id) -> последняя примененная ревизия
+
+    def ensure_loaded(self, db: Session):
+        if self.loaded:
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            self.subject_names = {s.id: s.name for s in db.query(models.Subject).all()}
+            self.group_names = {g.id: g.name for g in db.query(models.Group).all()}
+            self.entries = {}
+            self.group_grids = {}
+            self.room_grids = {}
+            self.revisions = {}
+            for table, model in (('subjects', models.Subject), ('groups', models.Group)):
+                for row_id, revision in db.query(model.id, model.revision).all():
+                    self.revisions[(table, row_id)] = revision
+            for schedule in db.query(models.Schedule).all():
+                self.revisions[('schedules', schedule.id)] = schedule.revision
+                self._add(schedule.id, schedule.group_id, schedule.subject_id,
+                          schedule.day_of_week, schedule.lesson_number, schedule.room)
+            self.loaded = True
+
+    def reset(self):
+        """Сброс: при следующем чтении сетки будут построены заново"""
+        with self.lock:
+            self.loaded = False
+
+    # === ИНКРЕМЕНТАЛЬНОЕ ОБНОВЛЕНИЕ ===
+
+    def _group_grid(self, group_id):
+        grid = self.group_grids.get(group_id)
+        if grid is None:
+            grid = TimetableGrid({'group_id': group_id, 'group': self.group_names.get(group_id)})
+            self.group_grids[group_id] = grid
+        return grid
+
+    def _room_grid(self, room):
+        grid = self.room_grids.get(room)
+        if grid is None:
+            grid = TimetableGrid({'room': room})
+            self.room_grids[room] = grid
+        return grid
+
+    def _add(self, schedule_id, group_id, subject_id, day_of_week, lesson_number, room):
+        index = slot_index(day_of_week, lesson_number)
+        if index is None:
+            return
+        entry = {
+            'id': schedule_id,
+            'group_id': group_id,
+            'group': self.group_names.get(group_id),
+            'subject_id': subject_id,
+            'subject': self.subject_names.get(subject_id, 'Неизвестно'),
+            'room': room,
+        }
+        self.entries[schedule_id] = (entry, index)
+        self._group_grid(group_id).add(index, entry)
+        if room:
+            self._room_grid(room).add(index, entry)
+
+    def _remove(self, schedule_id):
+        item = self.entries.pop(schedule_id, None)
+        if item is None:
+            return
+        entry, index = item
+        self._group_grid(entry['group_id']).remove(index, schedule_id)
+        if entry['room']:
+            grid = self.room_grids[entry['room']]
+            grid.remove(index, schedule_id)
+            if grid.count == 0:
+                del self.room_grids[entry['room']]
+
+    def _rename(self, key, entity_id, name):
+        for entry, _ in self.entries.values():
+            if entry[key + '_id'] == entity_id:
+                entry[key] = name
+                self._group_grid(entry['group_id']).invalidate()
+                if entry['room']:
+                    self.room_grids[entry['room']].invalidate()
+
+    def _is_stale(self, table, row):
+        """Проверка ревизии; свежая ревизия запоминается"""
+        revision = row.get('revision')
+        if revision is None:
+            return False
+        known = self.revisions.get((table, row['id']))
+        if known is not None and revision < known:
+            return True
+        self.revisions[(table, row['id'])] = revision
+        return False
+
+    def apply_change(self, table, action, row):
+        """Применение изменения строки (те же данные, что уходят в ленту изменений)"""
+        with self.lock:
+            if not self.loaded or self._is_stale(table, row):
+                return
+            if table == 'schedules':
+                self._remove(row['id'])
+                if action != 'delete':
+                    self._add(row['id'], row['group_id'], row['subject_id'],
+                              row['day_of_week'], row['lesson_number'], row['room'])
+            elif table == 'subjects':
+                if action == 'delete':
+                    self.subject_names.pop(row['id'], None)
+                else:
+                    self.subject_names[row['id']] = row['name']
+                    self._rename('subject', row['id'], row['name'])
+            elif table == 'groups':
+                if action == 'delete':
+                    self.group_names.pop(row['id'], None)
+                    self.group_grids.pop(row['id'], None)
+                else:
+                    self.group_names[row['id']] = row['name']
+                    grid = self._group_grid(row['id'])
+                    grid.header['group'] = row['name']
+                    grid.invalidate()
+                    self._rename('group', row['id'], row['name'])
+
+    # === ЧТЕНИЕ ===
+
+    def group_body(self, group_id):
+        """JSON сетки группы или None, если группы нет"""
+        with self.lock:
+            if group_id not in self.group_names:
+                return None
+            return self._group_grid(group_id).body()
+
+    def room_body(self, room):
+        """JSON сетки аудитории (пустая сетка, если занятий в ней нет)"""
+        with self.lock:
+            grid = self.room_grids.get(room)
+            if grid is None:
+                return TimetableGrid({'room': room}).body()
+            return grid.body()
+
+
+timetable = TimetableStore()